@@ -0,0 +1,845 @@
+import streamlit as st
+import openai
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+import asyncio
+import base64
+from PIL import Image
+import io
+import json
+import logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+try:
+    import pyvips
+except (ImportError, OSError):
+    # pyvips (and the libvips shared library it loads) is optional; without it
+    # every image is resized with Pillow
+    pyvips = None
+
+# --------------------------- #
+#       Configuration         #
+# --------------------------- #
+
+@st.cache_resource
+def _openai_client(api_key):
+    """
+    Create the OpenAI client once per API key and reuse it across reruns
+    and sessions, so its connection pool keeps TLS connections alive.
+    A rotated key produces a new client.
+    """
+    return OpenAI(
+        api_key=api_key,
+        base_url="https://api.openai.com/v1",
+        # Transient failures are retried by _retry_transient instead
+        max_retries=0
+    )
+
+@st.cache_resource
+def _async_openai_client(api_key):
+    """Create the async OpenAI client once per API key and reuse it across reruns."""
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url="https://api.openai.com/v1",
+        # Transient failures are retried by _retry_transient instead
+        max_retries=0
+    )
+
+# Initialize OpenAI client
+def init_openai_client():
+    """Initialize OpenAI client with API key from Streamlit secrets"""
+    try:
+        # Try to get API key from Streamlit secrets
+        api_key = st.secrets["OPENAI_API_KEY"]
+        
+        # Reuse the cached client for this API key
+        return _openai_client(api_key)
+    except Exception as e:
+        st.error("Error initializing OpenAI client. Please check your API key configuration.")
+        logging.error(f"OpenAI client initialization error: {e}")
+        return None
+
+def init_async_openai_client():
+    """Initialize async OpenAI client with API key from Streamlit secrets"""
+    try:
+        api_key = st.secrets["OPENAI_API_KEY"]
+        
+        return _async_openai_client(api_key)
+    except Exception as e:
+        logging.error(f"Async OpenAI client initialization error: {e}")
+        return None
+
+@st.cache_resource
+def _event_loop():
+    """
+    Long-lived event loop running on a daemon thread.
+
+    Streamlit runs the script on a plain thread with no event loop, and an
+    AsyncOpenAI client must stay on the loop it first used, so every async
+    call is scheduled onto this one loop rather than a fresh asyncio.run().
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def run_async(coro):
+    """
+    Run a coroutine to completion from the Streamlit script thread.
+
+    Parameters:
+        coro (Coroutine): The coroutine to run.
+
+    Returns:
+        Any: The coroutine's result.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result()
+
+# Maximum number of analysis requests in flight at once, to stay within rate limits
+MAX_CONCURRENT_REQUESTS = 10
+# Maximum number of image uploads in flight at once
+MAX_CONCURRENT_UPLOADS = 8
+
+# Errors worth retrying; anything else (e.g. AuthenticationError, BadRequestError)
+# is permanent and surfaces immediately
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Retry transient OpenAI errors with jittered exponential backoff
+_retry_transient = retry(
+    retry=retry_if_exception_type(RETRYABLE_ERRORS),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+
+@_retry_transient
+def _call_with_retry(method, **kwargs):
+    """Call an OpenAI client method, retrying transient errors."""
+    return method(**kwargs)
+
+@_retry_transient
+async def _acall_with_retry(method, **kwargs):
+    """Await an async OpenAI client method, retrying transient errors."""
+    return await method(**kwargs)
+
+# Define AI Prompts as Constants
+# These are sent verbatim as the system message; user-supplied text always goes
+# in a separate, later user message. At a few hundred tokens they are well below
+# the 1024-token minimum for OpenAI's automatic prompt caching, so this layout
+# keeps instructions and input apart but does not by itself produce cache hits.
+IMAGE_ANALYSIS_PROMPT = (
+    "You are an experienced licensed home inspector assisting another inspector in the field. "
+    "Please analyze the given image along with any provided text context (if any) and provide an analysis "
+    "of any deficiencies or conditions, safety concerns, functionality issues, etc.\n\n"
+    "When analyzing the image:\n"
+    "- If several images are provided, analyze each one in turn under its own heading "
+    "(Image 1, Image 2, ...), in the order given.\n"
+    "- Identify the component or system shown (e.g., roofing, electrical, plumbing, HVAC, structure, "
+    "exterior, interior, appliances) and describe its visible condition.\n"
+    "- List each deficiency you can observe, explaining what it is and why it matters.\n"
+    "- Call out any safety concerns first and clearly.\n"
+    "- Note functionality issues or signs of deferred maintenance, wear, moisture, or damage.\n"
+    "- Recommend an appropriate next step for each item (e.g., monitor, repair, or further evaluation "
+    "by a qualified licensed contractor).\n"
+    "- Use the user's context only to inform the analysis; do not speculate beyond what is visible, "
+    "and state when the image does not show enough detail to draw a conclusion.\n\n"
+    "Write in clear, professional language suitable for an inspection report."
+)
+
+DEFECT_ANALYSIS_PROMPT = (
+    "You are an experienced licensed home inspector helping to clarify inspection report language. "
+    "Please analyze the given deficiency comment and provide a more detailed breakdown of the comment "
+    "to allow for better understanding.\n\n"
+    "When breaking down the comment:\n"
+    "- Restate the deficiency in plain language a homeowner can understand.\n"
+    "- Explain the likely causes and the potential consequences if it is left unaddressed.\n"
+    "- Highlight any safety concerns.\n"
+    "- Indicate how urgent the issue is and who should address it (e.g., homeowner, handyman, "
+    "or a qualified licensed contractor).\n"
+    "- Do not invent details that are not supported by the comment.\n\n"
+    "Respond with three fields:\n"
+    "- summary: the detailed breakdown described above.\n"
+    "- severity: one of Minor, Moderate, Major, or Safety Hazard.\n"
+    "- recommended_action: the next step and who should take it.\n\n"
+    "Write in clear, professional language suitable for an inspection report."
+)
+
+# Labels for the dynamic user message, named once so both call sites read the
+# same way; this is for readability only and saves no allocation or prompt caching
+IMAGE_CONTEXT_PREFIX = "Context: "
+DEFECT_COMMENT_PREFIX = "Defect Comment: "
+
+# Structured output for defect analysis, so the UI can read fields directly
+DEFECT_BREAKDOWN_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "defect_breakdown",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "summary": {"type": "string"},
+                "severity": {"type": "string", "enum": ["Minor", "Moderate", "Major", "Safety Hazard"]},
+                "recommended_action": {"type": "string"}
+            },
+            "required": ["summary", "severity", "recommended_action"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# --------------------------- #
+#        AI Functions         #
+# --------------------------- #
+
+# Output token budget per image; a combined request asks for one section per
+# image, so its cap grows with the number of images
+MAX_OUTPUT_TOKENS_PER_IMAGE = 600
+
+# Define maximum dimensions (512px fits the single tile of the low-detail vision path)
+MAX_WIDTH = 512
+MAX_HEIGHT = 512
+# JPEGs already within the limits and under this size are sent as-is
+PASSTHROUGH_MAX_BYTES = 200_000
+# Images above this many pixels are resized with libvips when it is available
+VIPS_MIN_PIXELS = 4_000_000
+
+# File signatures of the accepted upload types
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+def is_supported_image(raw_bytes):
+    """
+    Check the file signature so non-image uploads are rejected before PIL parses them
+    
+    Parameters:
+        raw_bytes (bytes): Raw bytes of the uploaded file.
+        
+    Returns:
+        bool: True if the bytes start with a JPEG or PNG signature.
+    """
+    return raw_bytes.startswith(JPEG_MAGIC) or raw_bytes.startswith(PNG_MAGIC)
+
+def _process_image_vips(raw_bytes):
+    """
+    Resize and compress an image with libvips
+    
+    libvips shrinks while decoding and streams the image in tiles, so very
+    large photos are never fully materialized in memory.
+    
+    Parameters:
+        raw_bytes (bytes): Raw bytes of the uploaded image.
+        
+    Returns:
+        bytes: Compressed JPEG image
+    """
+    image = pyvips.Image.thumbnail_buffer(raw_bytes, MAX_WIDTH, height=MAX_HEIGHT, size="down")
+    
+    # JPEG cannot store alpha
+    if image.hasalpha():
+        image = image.flatten(background=[255])
+    
+    return image.jpegsave_buffer(Q=60, optimize_coding=True, strip=True)
+
+def process_image(image):
+    """
+    Resize and compress an opened image
+    
+    Parameters:
+        image (PIL.Image.Image): The opened image. Its pixels should not be loaded
+            yet, so large JPEGs can be decoded at a reduced scale.
+        
+    Returns:
+        bytes: Compressed JPEG image
+    """
+    # Let libjpeg decode large JPEGs at a reduced scale (1/2, 1/4 or 1/8) via
+    # DCT scaling instead of decoding every pixel and shrinking afterwards
+    image.draft("RGB", (MAX_WIDTH, MAX_HEIGHT))
+    
+    # JPEG cannot store alpha or palette images; flatten transparency onto white,
+    # as the libvips path does
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        image = Image.alpha_composite(Image.new("RGBA", image.size, "white"), image).convert("RGB")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    
+    # Resize the image while maintaining aspect ratio; bilinear is several times
+    # faster than the default Lanczos filter and indistinguishable at 512px
+    scale = min(MAX_WIDTH / image.width, MAX_HEIGHT / image.height)
+    if scale < 1:
+        target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(target, Image.Resampling.BILINEAR)
+    
+    # Compress the image by saving it with lower quality
+    buffered = io.BytesIO()
+    image.save(buffered, format="JPEG", quality=60, optimize=True, progressive=False)
+    
+    return buffered.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def process_image_cached(raw_bytes):
+    """
+    Process and compress uploaded image, memoized on its raw bytes
+    
+    Re-analyzing the same upload with a different context reuses the
+    compressed image instead of decoding and re-encoding it again.
+    
+    Parameters:
+        raw_bytes (bytes): Raw bytes of the uploaded image.
+        
+    Returns:
+        bytes: Compressed JPEG image
+    """
+    if not is_supported_image(raw_bytes):
+        raise ValueError("Error processing image: not a JPEG or PNG file")
+
+    try:
+        # Open the image (reads the header only; pixels are decoded at most once, below)
+        image = Image.open(io.BytesIO(raw_bytes))
+        
+        # Skip the decode/re-encode round-trip for already small JPEGs
+        if (
+            image.format == "JPEG"
+            and image.width <= MAX_WIDTH
+            and image.height <= MAX_HEIGHT
+            and len(raw_bytes) < PASSTHROUGH_MAX_BYTES
+        ):
+            return raw_bytes
+        
+        if pyvips is not None and image.width * image.height > VIPS_MIN_PIXELS:
+            return _process_image_vips(raw_bytes)
+        
+        return process_image(image)
+        
+    except Exception as e:
+        logging.error(f"Error processing image: {e}")
+        raise ValueError(f"Error processing image: {str(e)}")
+
+@st.cache_resource
+def _image_executor():
+    """Worker pool that runs image decode/resize/encode off the script thread."""
+    return ThreadPoolExecutor(max_workers=4)
+
+def process_images(images_bytes):
+    """
+    Process and compress several images in parallel on the worker pool
+    
+    Parameters:
+        images_bytes (list[bytes]): Raw bytes of the uploaded images.
+        
+    Returns:
+        list[bytes]: Compressed JPEG images, in input order
+    """
+    return list(_image_executor().map(process_image_cached, images_bytes))
+
+# Completed analyses are memoized for an hour, up to this many entries
+CACHE_TTL_SECONDS = 3600
+CACHE_MAX_ENTRIES = 256
+
+@st.cache_resource
+def _analysis_cache():
+    """
+    Process-wide LRU of completed analyses, shared by every session.
+
+    st.cache_data cannot memoize a streamed response, so the full text is
+    stored here once the stream has been consumed. IDs of images uploaded
+    to the Files API are kept here too, under their own key prefix.
+
+    Returns:
+        dict: The cache entries (OrderedDict) and the lock guarding them.
+    """
+    return {"entries": OrderedDict(), "lock": threading.Lock()}
+
+def cache_key(*parts):
+    """
+    Build a cache key from the request inputs.
+
+    Parameters:
+        *parts (str | bytes): Inputs that determine the analysis.
+
+    Returns:
+        str: SHA-256 hex digest of the inputs.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else part.encode('utf-8')
+        # Length-prefix each part so no two different part lists hash the same
+        # bytes (a separator could also occur inside image data)
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+def _cache_get(key):
+    """Return the cached value for key, or None if missing or expired."""
+    cache = _analysis_cache()
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+        if entry is None:
+            return None
+        stored_at, text = entry
+        if time.monotonic() - stored_at > CACHE_TTL_SECONDS:
+            del cache["entries"][key]
+            return None
+        cache["entries"].move_to_end(key)
+        return text
+
+def _cache_put(key, text):
+    """Store a value, evicting the least recently used entries."""
+    cache = _analysis_cache()
+    with cache["lock"]:
+        cache["entries"][key] = (time.monotonic(), text)
+        cache["entries"].move_to_end(key)
+        while len(cache["entries"]) > CACHE_MAX_ENTRIES:
+            cache["entries"].popitem(last=False)
+
+def _stream_cached(key, deltas):
+    """
+    Yield response text as it streams in, memoizing the full reply.
+
+    Parameters:
+        key (str): Cache key for the request.
+        deltas (Iterator[str]): Lazily started stream of text chunks; it is
+            never iterated (so no request is made) on a cache hit.
+
+    Yields:
+        str: Response text as it is generated (or the whole cached reply).
+    """
+    cached = _cache_get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    for delta in deltas:
+        parts.append(delta)
+        yield delta
+
+    # Never memoize an empty reply; the next request should try again
+    text = "".join(parts)
+    if text:
+        _cache_put(key, text)
+
+def _response_error(response):
+    """
+    Describe why a Responses API response did not complete.
+
+    Parameters:
+        response (Response): A failed or incomplete response.
+
+    Returns:
+        str: The error message, or the reason the response is incomplete.
+    """
+    if response.error is not None:
+        return response.error.message
+    if response.incomplete_details is not None:
+        return f"Response incomplete: {response.incomplete_details.reason}"
+    return f"Response {response.status}"
+
+def _response_deltas(client, **request):
+    """
+    Stream a Responses API request, yielding its text chunks.
+
+    Raises:
+        openai.OpenAIError: If the stream reports an error, or the response
+            fails or ends incomplete, so partial text is never cached.
+    """
+    for event in _call_with_retry(client.responses.create, stream=True, **request):
+        if event.type == "response.output_text.delta":
+            yield event.delta
+        elif event.type == "error":
+            raise openai.OpenAIError(event.message)
+        elif event.type in ("response.failed", "response.incomplete"):
+            raise openai.OpenAIError(_response_error(event.response))
+
+# Uploaded images expire on OpenAI's side after a day; the file IDs are only
+# reused for CACHE_TTL_SECONDS, well before that
+UPLOADED_FILE_TTL_SECONDS = 24 * 3600
+
+def _image_upload_args(jpeg_bytes):
+    """Build the client.files.create arguments for a compressed image."""
+    return {
+        "file": ("image.jpg", jpeg_bytes, "image/jpeg"),
+        "purpose": "vision",
+        "expires_after": {"anchor": "created_at", "seconds": UPLOADED_FILE_TTL_SECONDS}
+    }
+
+def upload_image_once(raw_bytes, client):
+    """
+    Upload a compressed image to the OpenAI Files API, once per image
+    
+    The file ID is memoized on the raw bytes, so analyzing the same image
+    again (e.g. with a different context) sends only the ID instead of the
+    whole base64 payload.
+    
+    Parameters:
+        raw_bytes (bytes): Raw bytes of the uploaded image.
+        client (OpenAI): OpenAI client instance.
+        
+    Returns:
+        str: The ID of the uploaded file.
+    """
+    key = cache_key("file", raw_bytes)
+    file_id = _cache_get(key)
+    if file_id is None:
+        file_id = _call_with_retry(client.files.create, **_image_upload_args(process_image_cached(raw_bytes))).id
+        _cache_put(key, file_id)
+    return file_id
+
+async def _upload_image_once_async(raw_bytes, client):
+    """Async counterpart of upload_image_once, sharing the same file ID memo."""
+    key = cache_key("file", raw_bytes)
+    file_id = _cache_get(key)
+    if file_id is None:
+        # Compress on the worker pool so the event loop keeps serving other requests
+        jpeg_bytes = await asyncio.get_running_loop().run_in_executor(
+            _image_executor(), process_image_cached, raw_bytes
+        )
+        file_id = (await _acall_with_retry(client.files.create, **_image_upload_args(jpeg_bytes))).id
+        _cache_put(key, file_id)
+    return file_id
+
+async def upload_all(images_bytes, client):
+    """
+    Upload several images to the OpenAI Files API concurrently
+    
+    Previously uploaded images reuse their memoized file IDs.
+    
+    Parameters:
+        images_bytes (list[bytes]): Raw bytes of the uploaded images.
+        client (AsyncOpenAI): Async OpenAI client instance.
+        
+    Returns:
+        list[str]: The IDs of the uploaded files, in input order.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+    async def _upload(raw_bytes):
+        async with semaphore:
+            return await _upload_image_once_async(raw_bytes, client)
+
+    return await asyncio.gather(*[_upload(raw_bytes) for raw_bytes in images_bytes])
+
+def _file_image_part(file_id):
+    """Reference an uploaded image in a Responses API message."""
+    # Low detail bills a flat 85 tokens per image instead of per 512px tile
+    return {"type": "input_image", "file_id": file_id, "detail": "low"}
+
+def _inline_image_part(jpeg_bytes):
+    """Embed a compressed image in a Responses API message as a base64 data URL."""
+    return {
+        "type": "input_image",
+        "image_url": f"data:image/jpeg;base64,{base64.b64encode(jpeg_bytes).decode('utf-8')}",
+        "detail": "low"
+    }
+
+def _image_request(image_parts, context, prompt):
+    """
+    Build the Responses API arguments for an image analysis.
+
+    All images go into a single request so the instruction prompt is only
+    sent (and billed) once per batch.
+
+    Parameters:
+        image_parts (list[dict]): input_image parts, from _file_image_part or _inline_image_part.
+        context (str): Additional text context provided by the user.
+        prompt (str): The AI prompt guiding the analysis.
+
+    Returns:
+        dict: Keyword arguments for client.responses.create.
+    """
+    return {
+        "model": "gpt-4o-mini-2024-07-18",  # Updated to use vision model
+        "input": [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": [{"type": "input_text", "text": IMAGE_CONTEXT_PREFIX + context}] + image_parts}
+        ],
+        "max_output_tokens": MAX_OUTPUT_TOKENS_PER_IMAGE * len(image_parts)
+    }
+
+def analyze_image(images_bytes, context, prompt, client, async_client=None):
+    """
+    Analyze one or more images together in a single OpenAI API request
+    
+    Parameters:
+        images_bytes (list[bytes]): Raw bytes of the uploaded images.
+        context (str): Additional text context provided by the user.
+        prompt (str): The AI prompt guiding the analysis.
+        client (OpenAI): OpenAI client instance.
+        async_client (AsyncOpenAI, optional): Used to upload several images concurrently.
+        
+    Yields:
+        str: Chunks of the AI-generated analysis.
+        
+    Raises:
+        openai.OpenAIError: If the request fails, including part-way through the stream.
+        ValueError: If an image cannot be processed.
+    """
+    try:
+        # Hash on the raw uploads so identical re-uploads hit the cache
+        key = cache_key("image", *images_bytes, context, prompt)
+        cached = _cache_get(key)
+        if cached is not None:
+            # Skip uploading the images on a cache hit
+            yield cached
+            return
+
+        # Upload the images (reusing earlier uploads of the same images), in parallel
+        # when there are several, so only the small file IDs go in the completion call
+        if async_client is not None and len(images_bytes) > 1:
+            file_ids = run_async(upload_all(images_bytes, async_client))
+        else:
+            file_ids = [upload_image_once(image_bytes, client) for image_bytes in images_bytes]
+        
+        # Make API request
+        request = _image_request([_file_image_part(f) for f in file_ids], context, prompt)
+        yield from _stream_cached(key, _response_deltas(client, **request))
+        
+    except (openai.OpenAIError, ValueError) as e:
+        # Raise rather than yield the message, so text streamed before a failure
+        # is never mistaken for a complete analysis
+        logging.error(f"Error in analyze_image: {e}")
+        raise
+
+async def _analyze_image_async(image_bytes, context, prompt, client, semaphore):
+    """
+    Analyze a single image with the async client, without streaming.
+
+    Parameters:
+        image_bytes (bytes): Raw bytes of the uploaded image.
+        context (str): Additional text context provided by the user.
+        prompt (str): The AI prompt guiding the analysis.
+        client (AsyncOpenAI): Async OpenAI client instance.
+        semaphore (asyncio.Semaphore): Caps the number of requests in flight.
+
+    Returns:
+        str | Exception: The AI-generated analysis, or the error that prevented it.
+    """
+    try:
+        key = cache_key("image", image_bytes, context, prompt)
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
+
+        async with semaphore:
+            file_id = await _upload_image_once_async(image_bytes, client)
+            response = await _acall_with_retry(
+                client.responses.create, **_image_request([_file_image_part(file_id)], context, prompt)
+            )
+        if response.status != "completed":
+            raise openai.OpenAIError(_response_error(response))
+        analysis = response.output_text
+        if not analysis:
+            raise openai.OpenAIError("Empty response")
+        _cache_put(key, analysis)
+        return analysis
+        
+    except (openai.OpenAIError, ValueError) as e:
+        logging.error(f"Error in analyze_image: {e}")
+        return e
+
+async def analyze_images_batch(images_bytes, context, prompt, client):
+    """
+    Analyze several images concurrently, one request per image
+    
+    Parameters:
+        images_bytes (list[bytes]): Raw bytes of the uploaded images.
+        context (str): Additional text context provided by the user.
+        prompt (str): The AI prompt guiding the analysis.
+        client (AsyncOpenAI): Async OpenAI client instance.
+        
+    Returns:
+        list[str | Exception]: The AI-generated analyses (or the errors that prevented
+        them), in upload order.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return await asyncio.gather(
+        *[_analyze_image_async(b, context, prompt, client, semaphore) for b in images_bytes]
+    )
+
+def build_image_batch_jobs(image_names, images_bytes, context, prompt):
+    """
+    Build one Batch API job per image
+    
+    Parameters:
+        image_names (list[str]): File names of the uploaded images.
+        images_bytes (list[bytes]): Raw bytes of the uploaded images.
+        context (str): Additional text context provided by the user.
+        prompt (str): The AI prompt guiding the analysis.
+        
+    Returns:
+        list[dict]: Jobs with a unique custom_id and the Responses API request body.
+    """
+    # Batch jobs embed the images inline: an uploaded file could expire before the batch runs
+    jpeg_images = process_images(images_bytes)
+    return [
+        {
+            "custom_id": f"{index}-{name}",
+            "body": _image_request([_inline_image_part(jpeg_bytes)], context, prompt)
+        }
+        for index, (name, jpeg_bytes) in enumerate(zip(image_names, jpeg_images), start=1)
+    ]
+
+def submit_batch(jobs, client):
+    """
+    Submit Responses API jobs to the OpenAI Batch API
+    
+    Batch jobs cost half as much as synchronous requests and complete
+    within 24 hours, which suits bulk or archival inspections.
+    
+    Parameters:
+        jobs (list[dict]): Jobs built by build_image_batch_jobs.
+        client (OpenAI): OpenAI client instance.
+        
+    Returns:
+        str: The ID of the created batch.
+    """
+    lines = [
+        json.dumps({
+            "custom_id": job["custom_id"],
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": job["body"]
+        })
+        for job in jobs
+    ]
+    batch_file = _call_with_retry(
+        client.files.create,
+        file=("batch.jsonl", "\n".join(lines).encode('utf-8'), "application/jsonl"),
+        purpose="batch"
+    )
+    batch = _call_with_retry(
+        client.batches.create,
+        input_file_id=batch_file.id,
+        endpoint="/v1/responses",
+        completion_window="24h"
+    )
+    return batch.id
+
+# Batches in these states will not change again; expired and cancelled batches
+# still write output and error files for the requests that did finish
+BATCH_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+def parse_batch_results(content):
+    """
+    Parse a Batch API output or error file
+    
+    Parameters:
+        content (str): The file's JSONL text.
+        
+    Returns:
+        dict[str, str | Exception]: Mapping of custom_id to the AI-generated
+        analysis, or the error that prevented it.
+    """
+    results = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if response.get("status_code") != 200:
+            error = record.get("error") or body.get("error") or {}
+            results[record["custom_id"]] = openai.OpenAIError(error.get("message", "Unknown error"))
+        elif body.get("status") != "completed":
+            # e.g. "incomplete" after hitting max_output_tokens; the text is truncated
+            details = body.get("incomplete_details") or {}
+            results[record["custom_id"]] = openai.OpenAIError(
+                f"Response incomplete: {details['reason']}" if details.get("reason")
+                else f"Response {body.get('status')}"
+            )
+        else:
+            results[record["custom_id"]] = "".join(
+                part["text"]
+                for item in body["output"] if item["type"] == "message"
+                for part in item["content"] if part["type"] == "output_text"
+            )
+    return results
+
+def check_batch(batch_id, client):
+    """
+    Check a submitted batch and collect its results once it has finished
+    
+    Parameters:
+        batch_id (str): The ID returned by submit_batch.
+        client (OpenAI): OpenAI client instance.
+        
+    Returns:
+        tuple[str, dict | None]: The batch status and, once it has finished, a
+        mapping of custom_id to the AI-generated analysis or the error that
+        prevented it.
+    """
+    batch = _call_with_retry(client.batches.retrieve, batch_id=batch_id)
+    if batch.status not in BATCH_TERMINAL_STATUSES:
+        return batch.status, None
+
+    # Successful requests go to the output file and failed ones to the error file;
+    # either may be missing when every request landed in the other
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            content = _call_with_retry(client.files.content, file_id=file_id).text
+            results.update(parse_batch_results(content))
+    return batch.status, results
+
+def analyze_defect(defect_text, prompt, client):
+    """
+    Analyze defect comment using OpenAI API
+    
+    Parameters:
+        defect_text (str): The defect comment/narrative provided by the user.
+        prompt (str): The AI prompt guiding the analysis.
+        client (OpenAI): OpenAI client instance.
+        
+    Returns:
+        dict: The AI-generated breakdown (summary, severity and recommended_action).
+        
+    Raises:
+        openai.OpenAIError: If the request fails, is refused or is cut off.
+        ValueError: If the reply is not valid JSON.
+    """
+    try:
+        key = cache_key("defect", defect_text, prompt)
+        breakdown_json = _cache_get(key)
+        if breakdown_json is None:
+            response = _call_with_retry(
+                client.chat.completions.create,
+                model="gpt-4o-mini-2024-07-18",  # Updated to use latest GPT-4 model
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {
+                        "role": "user",
+                        "content": DEFECT_COMMENT_PREFIX + defect_text
+                    }
+                ],
+                response_format=DEFECT_BREAKDOWN_FORMAT,
+                max_tokens=400
+            )
+            choice = response.choices[0]
+            if choice.finish_reason == "length":
+                # The JSON was cut off at max_tokens and would not parse
+                raise openai.OpenAIError("Response incomplete: max_tokens")
+            message = choice.message
+            if message.refusal:
+                raise openai.OpenAIError(f"Refused: {message.refusal}")
+            breakdown_json = message.content
+            # Parse before caching so a truncated reply is never memoized
+            breakdown = json.loads(breakdown_json)
+            _cache_put(key, breakdown_json)
+        else:
+            breakdown = json.loads(breakdown_json)
+        return breakdown
+        
+    except (openai.OpenAIError, ValueError) as e:
+        logging.error(f"Error in analyze_defect: {e}")
+        raise
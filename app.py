@@ -1,12 +1,24 @@
 import streamlit as st
 import openai
-from openai import OpenAI
-import base64
-from PIL import Image
-import io
-import os
+import itertools
 import logging
 
+from ai import (
+    DEFECT_ANALYSIS_PROMPT,
+    IMAGE_ANALYSIS_PROMPT,
+    analyze_defect,
+    analyze_image,
+    analyze_images_batch,
+    build_image_batch_jobs,
+    cache_key,
+    check_batch,
+    init_async_openai_client,
+    init_openai_client,
+    is_supported_image,
+    run_async,
+    submit_batch,
+)
+
 # --------------------------- #
 #       Configuration         #
 # --------------------------- #
@@ -14,147 +26,41 @@ import logging
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-# Initialize OpenAI client
-def init_openai_client():
-    """Initialize OpenAI client with API key from Streamlit secrets"""
-    try:
-        # Try to get API key from Streamlit secrets
-        api_key = st.secrets["OPENAI_API_KEY"]
-        
-        # Initialize client with the API key
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.openai.com/v1"
-        )
-        
-        return client
-    except Exception as e:
-        st.error("Error initializing OpenAI client. Please check your API key configuration.")
-        logging.error(f"OpenAI client initialization error: {e}")
-        return None
-
-# Define AI Prompts as Constants
-IMAGE_ANALYSIS_PROMPT = (
-    "Please analyze the given image along with any provided text context (if any) and provide an analysis "
-    "of any deficiencies or conditions, safety concerns, functionality issues, etc."
-)
-
-DEFECT_ANALYSIS_PROMPT = (
-    "Please analyze the given deficiency comment and provide a more detailed breakdown of the comment "
-    "to allow for better understanding."
-)
-
 # --------------------------- #
-#        AI Functions         #
+#         Streamlit UI        #
 # --------------------------- #
 
-def process_image(image_file):
+def render_image_analysis(result):
     """
-    Process and compress uploaded image
+    Render a stored image analysis
     
     Parameters:
-        image_file (UploadedFile): The image file uploaded by the user.
-        
-    Returns:
-        str: Base64 encoded image string or error message
+        result (str | list[tuple[str, str | Exception]]): A combined analysis, or
+            (file name, analysis or error) pairs from per-image requests.
     """
-    # Define maximum dimensions
-    MAX_WIDTH = 800
-    MAX_HEIGHT = 800
-
-    try:
-        # Open the image
-        image = Image.open(image_file)
-        
-        # Resize the image while maintaining aspect ratio
-        image.thumbnail((MAX_WIDTH, MAX_HEIGHT))
-        
-        # Compress the image by saving it with lower quality
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG", quality=70)
-        
-        # Get the byte data and encode to Base64
-        image_bytes = buffered.getvalue()
-        return base64.b64encode(image_bytes).decode('utf-8')
-        
-    except Exception as e:
-        logging.error(f"Error processing image: {e}")
-        raise Exception(f"Error processing image: {str(e)}")
+    st.subheader("📊 Analysis Results")
+    if isinstance(result, str):
+        st.write(result)
+        return
+    for name, analysis in result:
+        st.markdown(f"**{name}**")
+        if isinstance(analysis, Exception):
+            st.error(f"❌ Failed to retrieve analysis. Error: {analysis}")
+        else:
+            st.write(analysis)
 
-def analyze_image(image_file, context, prompt, client):
+def render_defect_breakdown(breakdown):
     """
-    Analyze image using OpenAI API
+    Render a structured defect breakdown
     
     Parameters:
-        image_file (UploadedFile): The image file uploaded by the user.
-        context (str): Additional text context provided by the user.
-        prompt (str): The AI prompt guiding the analysis.
-        client (OpenAI): OpenAI client instance.
-        
-    Returns:
-        str: The AI-generated analysis or an error message.
+        breakdown (dict): The summary, severity and recommended_action fields.
     """
-    try:
-        # Process the image
-        base64_image = process_image(image_file)
-        
-        # Make API request
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",  # Updated to use vision model
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": f"{prompt}\n\nContext: {context}"},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000
-        )
-        return response.choices[0].message.content
-        
-    except Exception as e:
-        logging.error(f"Error in analyze_image: {e}")
-        return f"Error: {str(e)}"
-
-def analyze_defect(defect_text, prompt, client):
-    """
-    Analyze defect comment using OpenAI API
-    
-    Parameters:
-        defect_text (str): The defect comment/narrative provided by the user.
-        prompt (str): The AI prompt guiding the analysis.
-        client (OpenAI): OpenAI client instance.
-        
-    Returns:
-        str: The AI-generated detailed breakdown or an error message.
-    """
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",  # Updated to use latest GPT-4 model
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"{prompt}\n\nDefect Comment: {defect_text}"
-                }
-            ],
-            max_tokens=1000
-        )
-        return response.choices[0].message.content
-        
-    except Exception as e:
-        logging.error(f"Error in analyze_defect: {e}")
-        return f"Error: {str(e)}"
-
-# --------------------------- #
-#         Streamlit UI        #
-# --------------------------- #
+    st.subheader("📊 Detailed Breakdown")
+    st.metric("Severity", breakdown["severity"])
+    st.write(breakdown["summary"])
+    st.markdown("**Recommended Action**")
+    st.write(breakdown["recommended_action"])
 
 def main():
     """Main function to run the Streamlit app"""
@@ -168,10 +74,15 @@ def main():
     if client is None:
         st.error("Failed to initialize OpenAI client. Please check your configuration.")
         return
+    async_client = init_async_openai_client()
 
     # Provide informational message
     st.info("📌 Please ensure that your images are clear and within the 5MB size limit for optimal analysis.")
 
+    # Analyses from this session, keyed on hashes of their inputs, so reruns
+    # (e.g. editing a text area) neither lose them nor repeat the API call
+    analyses = st.session_state.setdefault("analyses", {})
+
     # Create two tabs: Image Analysis and Defect Information
     tab1, tab2 = st.tabs(["🖼️ Image Analysis", "🔍 Defect Information"])
 
@@ -181,20 +92,44 @@ def main():
     with tab1:
         st.header("🖼️ Image Analysis")
         
-        # File Uploader for Image
-        uploaded_file = st.file_uploader("📤 Upload an image (Max 5MB)", type=['png', 'jpg', 'jpeg'])
+        # File Uploader for Images
+        uploaded_files = st.file_uploader(
+            "📤 Upload one or more images (Max 5MB each)",
+            type=['png', 'jpg', 'jpeg'],
+            accept_multiple_files=True
+        )
+        
+        # Keep each upload's bytes in session state so reruns (e.g. context edits)
+        # reuse them instead of reading the UploadedFile again
+        upload_bytes = st.session_state.setdefault("upload_bytes", {})
+        current_ids = {uploaded_file.file_id for uploaded_file in uploaded_files}
+        for file_id in list(upload_bytes):
+            if file_id not in current_ids:
+                del upload_bytes[file_id]
         
-        if uploaded_file is not None:
-            # Check file size
-            file_size = len(uploaded_file.getvalue())
+        valid_files = []
+        valid_images = []
+        for uploaded_file in uploaded_files:
+            # Check file size before reading the upload into memory
+            if uploaded_file.size > 5 * 1024 * 1024:  # 5MB limit
+                st.error(f"❌ {uploaded_file.name} exceeds the 5MB size limit. Please upload a smaller image.")
+                continue
             
-            if file_size > 5 * 1024 * 1024:  # 5MB limit
-                st.error("❌ The uploaded image exceeds the 5MB size limit. Please upload a smaller image.")
+            # Read the upload once and reuse the bytes for every step below
+            raw_bytes = upload_bytes.get(uploaded_file.file_id)
+            if raw_bytes is None:
+                raw_bytes = upload_bytes[uploaded_file.file_id] = uploaded_file.getvalue()
+            
+            # Check the file signature before anything tries to decode it
+            if not is_supported_image(raw_bytes):
+                st.error(f"❌ {uploaded_file.name} is not a valid JPEG or PNG image.")
             else:
+                valid_files.append(uploaded_file)
+                valid_images.append(raw_bytes)
                 try:
-                    # Display uploaded image
-                    image = Image.open(uploaded_file)
-                    st.image(image, caption="📸 Uploaded Image", use_column_width=True)
+                    # Display uploaded image straight from the bytes; the browser decodes it,
+                    # so the only server-side decode is the one in process_image
+                    st.image(raw_bytes, caption=f"📸 {uploaded_file.name}", use_column_width=True)
                 except Exception as e:
                     st.error(f"Error displaying image: {str(e)}")
         
@@ -209,18 +144,107 @@ def main():
             st.warning("⚠️ Additional context should be under 500 characters.")
             context = context[:500]
         
+        # Multiple images share one request by default; optionally fan out one request per image
+        analyze_separately = st.checkbox(
+            "Analyze each image in a separate request",
+            value=False,
+            disabled=len(valid_files) < 2
+        )
+        
+        separate_requests = analyze_separately and len(valid_files) > 1
+        image_key = (
+            "separate" if separate_requests else "combined",
+            cache_key(*valid_images),
+            cache_key(context)
+        )
+        rendered = False
+        
         # Analyze Button
         if st.button("🔍 Analyze Image", key="analyze_image"):
-            if uploaded_file is None:
+            if not valid_files:
                 st.warning("⚠️ Please upload an image to analyze.")
-            else:
-                with st.spinner("⏳ Analyzing image..."):
-                    analysis = analyze_image(uploaded_file, context, IMAGE_ANALYSIS_PROMPT, client)
+            elif image_key in analyses:
+                # Already analyzed in this session; shown below without another API call
+                st.session_state["last_image_analysis"] = image_key
+            elif not separate_requests:
+                stream = analyze_image(valid_images, context, IMAGE_ANALYSIS_PROMPT, client, async_client)
+                rendered = True
+                try:
+                    # Keep the spinner only until the first token arrives
+                    with st.spinner("⏳ Analyzing image..."):
+                        first_chunk = next(stream, "")
+                    st.subheader("📊 Analysis Results")
+                    analysis = st.write_stream(itertools.chain([first_chunk], stream))
+                except (openai.OpenAIError, ValueError) as e:
+                    # Any text streamed before the failure stays visible but is not stored
+                    st.error(f"❌ Failed to retrieve analysis. Error: {e}")
+                    st.session_state.pop("last_image_analysis", None)
+                else:
                     if analysis:
-                        st.subheader("📊 Analysis Results")
-                        st.write(analysis)
+                        analyses[image_key] = analysis
+                        st.session_state["last_image_analysis"] = image_key
                     else:
                         st.error("❌ Failed to retrieve analysis.")
+                        st.session_state.pop("last_image_analysis", None)
+            elif async_client is None:
+                st.error("❌ Failed to initialize the async OpenAI client required for multiple images.")
+            else:
+                # Analyze every image concurrently
+                with st.spinner(f"⏳ Analyzing {len(valid_files)} images..."):
+                    results = run_async(
+                        analyze_images_batch(valid_images, context, IMAGE_ANALYSIS_PROMPT, async_client)
+                    )
+                result = [(f.name, analysis) for f, analysis in zip(valid_files, results)]
+                if any(isinstance(analysis, Exception) for analysis in results):
+                    # Show the failures without storing them, so the next click retries
+                    render_image_analysis(result)
+                    rendered = True
+                    st.session_state.pop("last_image_analysis", None)
+                else:
+                    analyses[image_key] = result
+                    st.session_state["last_image_analysis"] = image_key
+        
+        # Show the most recent analysis on every rerun so widget edits don't blank it
+        last_image_key = st.session_state.get("last_image_analysis")
+        if not rendered and last_image_key in analyses:
+            render_image_analysis(analyses[last_image_key])
+
+        # Batch Processing (non-interactive, lower cost)
+        st.subheader("📦 Batch Processing")
+        st.caption("Queue images for the OpenAI Batch API: results within 24 hours at half the cost.")
+        batch_ids = st.session_state.setdefault("batch_ids", [])
+        
+        if st.button("📦 Queue for batch processing", key="queue_batch"):
+            if not valid_files:
+                st.warning("⚠️ Please upload an image to analyze.")
+            else:
+                try:
+                    with st.spinner("⏳ Submitting batch..."):
+                        jobs = build_image_batch_jobs(
+                            [f.name for f in valid_files], valid_images, context, IMAGE_ANALYSIS_PROMPT
+                        )
+                        batch_ids.append(submit_batch(jobs, client))
+                    st.success(f"✅ Queued {len(jobs)} image(s) as batch {batch_ids[-1]}.")
+                except (openai.OpenAIError, ValueError) as e:
+                    logging.error(f"Error submitting batch: {e}")
+                    st.error(f"❌ Failed to submit batch: {str(e)}")
+        
+        if batch_ids and st.button("🔄 Check batch status", key="check_batch"):
+            for batch_id in batch_ids:
+                try:
+                    status, results = check_batch(batch_id, client)
+                except openai.OpenAIError as e:
+                    logging.error(f"Error checking batch {batch_id}: {e}")
+                    st.error(f"❌ Failed to check batch {batch_id}: {str(e)}")
+                    continue
+                st.markdown(f"**Batch {batch_id}:** {status}")
+                if results is not None:
+                    for custom_id, analysis in results.items():
+                        with st.expander(custom_id):
+                            if isinstance(analysis, Exception):
+                                st.error(f"❌ Failed to retrieve analysis. Error: {analysis}")
+                            else:
+                                st.write(analysis)
 
     # --------------------------- #
     #    Tab 2: Defect Information#
@@ -244,13 +268,23 @@ def main():
             if not defect_text.strip():
                 st.warning("⚠️ Please enter a defect description to analyze.")
             else:
-                with st.spinner("⏳ Analyzing defect information..."):
-                    detailed_analysis = analyze_defect(defect_text, DEFECT_ANALYSIS_PROMPT, client)
-                    if detailed_analysis:
-                        st.subheader("📊 Detailed Breakdown")
-                        st.write(detailed_analysis)
-                    else:
-                        st.error("❌ Failed to retrieve detailed analysis.")
+                defect_key = ("defect", cache_key(defect_text))
+                if defect_key not in analyses:
+                    try:
+                        with st.spinner("⏳ Analyzing defect information..."):
+                            analyses[defect_key] = analyze_defect(defect_text, DEFECT_ANALYSIS_PROMPT, client)
+                    except (openai.OpenAIError, ValueError) as e:
+                        st.error(f"❌ Failed to retrieve detailed analysis. Error: {e}")
+                if defect_key in analyses:
+                    st.session_state["last_defect_analysis"] = defect_key
+                else:
+                    # Don't show an earlier breakdown for different text as if it were this one
+                    st.session_state.pop("last_defect_analysis", None)
+        
+        # Show the most recent breakdown on every rerun so widget edits don't blank it
+        last_defect_key = st.session_state.get("last_defect_analysis")
+        if last_defect_key in analyses:
+            render_defect_breakdown(analyses[last_defect_key])
 
 # --------------------------- #
 #        Execute App          #
@@ -0,0 +1,64 @@
+import json
+
+import openai
+
+from ai import parse_batch_results
+
+
+def _line(custom_id, response=None, error=None):
+    return json.dumps({"id": "batch_req_1", "custom_id": custom_id, "response": response, "error": error})
+
+
+def test_parse_batch_results_success():
+    content = _line("1-roof.jpg", response={
+        "status_code": 200,
+        "body": {
+            "status": "completed",
+            "output": [
+                {"type": "reasoning", "summary": []},
+                {"type": "message", "content": [
+                    {"type": "output_text", "text": "Missing "},
+                    {"type": "output_text", "text": "shingles."}
+                ]}
+            ]
+        }
+    })
+
+    assert parse_batch_results(content) == {"1-roof.jpg": "Missing shingles."}
+
+
+def test_parse_batch_results_incomplete_response():
+    content = _line("1-roof.jpg", response={
+        "status_code": 200,
+        "body": {
+            "status": "incomplete",
+            "incomplete_details": {"reason": "max_output_tokens"},
+            "output": [{"type": "message", "content": [{"type": "output_text", "text": "Missing"}]}]
+        }
+    })
+
+    result = parse_batch_results(content)["1-roof.jpg"]
+    assert isinstance(result, openai.OpenAIError)
+    assert str(result) == "Response incomplete: max_output_tokens"
+
+
+def test_parse_batch_results_request_error():
+    content = _line("2-attic.png", error={"code": "batch_expired", "message": "This request expired."})
+
+    result = parse_batch_results(content)["2-attic.png"]
+    assert isinstance(result, openai.OpenAIError)
+    assert str(result) == "This request expired."
+
+
+def test_parse_batch_results_http_error():
+    content = "\n".join([
+        _line("1-roof.jpg", response={
+            "status_code": 400,
+            "body": {"error": {"message": "Invalid image.", "type": "invalid_request_error"}}
+        }),
+        ""
+    ])
+
+    result = parse_batch_results(content)["1-roof.jpg"]
+    assert isinstance(result, openai.OpenAIError)
+    assert str(result) == "Invalid image."